@@ -1,251 +1,521 @@
-# backend.py
-# Requirements: pip install fastapi uvicorn sqlalchemy databases aiosqlite pydantic passlib
-# Run command: uvicorn backend:app --reload
-
-import asyncio
-import json
-import hashlib
-import uuid
-import random
-from datetime import datetime
-from typing import List, Optional, Dict, Any
-
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import sqlalchemy
-from databases import Database
-
-# --- DATABASE CONFIGURATION ---
-DATABASE_URL = "sqlite:///./smart_home.db"
-
-# --- DATABASE SCHEMA ---
-metadata = sqlalchemy.MetaData()
-
-# 1. Users Table (Authentication)
-users = sqlalchemy.Table(
-    "users",
-    metadata,
-    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
-    sqlalchemy.Column("username", sqlalchemy.String, unique=True, nullable=False),
-    sqlalchemy.Column("password_hash", sqlalchemy.String, nullable=False),
-    sqlalchemy.Column("created_at", sqlalchemy.DateTime, default=datetime.utcnow),
-)
-
-# 2. Sensors Table (Device Status)
-# is_triggered: 0=Safe, 1=Standard (Blue), 2=Warning (Orange), 3=Critical (Red)
-sensors = sqlalchemy.Table(
-    "sensors",
-    metadata,
-    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
-    sqlalchemy.Column("name", sqlalchemy.String, nullable=False),
-    sqlalchemy.Column("type", sqlalchemy.String, nullable=False),
-    sqlalchemy.Column("is_triggered", sqlalchemy.Integer, nullable=False, default=0),
-    sqlalchemy.Column("sensitivity", sqlalchemy.Float, nullable=False, default=1.0),
-    sqlalchemy.Column("created_at", sqlalchemy.DateTime, default=datetime.utcnow),
-)
-
-# 3. Events Table (Logs)
-events = sqlalchemy.Table(
-    "events",
-    metadata,
-    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
-    sqlalchemy.Column("timestamp", sqlalchemy.DateTime, nullable=False),
-    sqlalchemy.Column("level", sqlalchemy.String, nullable=False),
-    sqlalchemy.Column("source", sqlalchemy.String, nullable=False),
-    sqlalchemy.Column("payload", sqlalchemy.String, nullable=True),
-)
-
-# 4. Risk Assessments Table (Quiz Results)
-risk_assessments = sqlalchemy.Table(
-    "risk_assessments",
-    metadata,
-    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
-    sqlalchemy.Column("timestamp", sqlalchemy.DateTime, default=datetime.utcnow),
-    sqlalchemy.Column("score", sqlalchemy.Integer, nullable=False),
-    sqlalchemy.Column("risk_level", sqlalchemy.String, nullable=False),
-    sqlalchemy.Column("details", sqlalchemy.String, nullable=True),
-)
-
-engine = sqlalchemy.create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-metadata.create_all(engine)
-db = Database(DATABASE_URL)
-
-# --- PYDANTIC MODELS ---
-class UserAuth(BaseModel):
-    username: str
-    password: str
-
-class SensorOut(BaseModel):
-    id: str
-    name: str
-    type: str
-    is_triggered: int
-    sensitivity: float
-
-class EventOut(BaseModel):
-    id: str
-    timestamp: datetime
-    level: str
-    source: str
-    payload: Optional[Dict[str, Any]]
-
-class RiskAssessmentIn(BaseModel):
-    score: int
-    details: Dict[str, Any]
-
-class RiskAssessmentOut(BaseModel):
-    score: int
-    risk_level: str
-    timestamp: datetime
-
-# --- APP & MIDDLEWARE ---
-app = FastAPI(title="Smart Home Security Hub")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], # Allow HTML file to connect
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# --- WEBSOCKET MANAGER ---
-class ConnectionManager:
-    def __init__(self):
-        self.active: List[WebSocket] = []
-    async def connect(self, ws: WebSocket):
-        await ws.accept()
-        self.active.append(ws)
-    def disconnect(self, ws: WebSocket):
-        if ws in self.active: self.active.remove(ws)
-    async def broadcast(self, message: dict):
-        for conn in list(self.active):
-            try: await conn.send_text(json.dumps(message, default=str))
-            except: self.disconnect(conn)
-
-manager = ConnectionManager()
-
-# --- HELPERS ---
-async def log_event(level: str, source: str, payload: Optional[dict] = None):
-    ev_id = str(uuid.uuid4())
-    now = datetime.utcnow()
-    await db.execute(events.insert().values(
-        id=ev_id, timestamp=now, level=level, source=source, 
-        payload=json.dumps(payload) if payload else None
-    ))
-    await manager.broadcast({"type": "event", "event": {"level": level, "source": source, "payload": payload}})
-
-# --- LIFECYCLE ---
-@app.on_event("startup")
-async def startup():
-    await db.connect()
-    # Seed Sensors if empty
-    if await db.fetch_val(sqlalchemy.select([sqlalchemy.func.count()]).select_from(sensors)) == 0:
-        seed = [
-            ("Front Door", "door"), 
-            ("Kitchen Window", "window"), 
-            ("Living Room Motion", "motion"), 
-            ("Backyard Camera", "camera")
-        ]
-        for name, type_ in seed:
-            await db.execute(sensors.insert().values(
-                id=str(uuid.uuid4()), name=name, type=type_, is_triggered=0
-            ))
-
-@app.on_event("shutdown")
-async def shutdown():
-    await db.disconnect()
-
-# ================= ENDPOINTS =================
-
-@app.get("/")
-async def root():
-    return {"status": "Smart Home Backend Online"}
-
-# --- AUTH ---
-@app.post("/register")
-async def register(user: UserAuth):
-    # Check existing
-    query = sqlalchemy.select([users]).where(users.c.username == user.username)
-    if await db.fetch_one(query):
-        raise HTTPException(status_code=400, detail="Username already exists")
-
-    # Hash Password (SHA256 for demo simplicity)
-    hashed = hashlib.sha256(user.password.encode()).hexdigest()
-    
-    await db.execute(users.insert().values(
-        id=str(uuid.uuid4()),
-        username=user.username,
-        password_hash=hashed,
-        created_at=datetime.utcnow()
-    ))
-    return {"status": "success"}
-
-@app.post("/login")
-async def login(user: UserAuth):
-    query = sqlalchemy.select([users]).where(users.c.username == user.username)
-    record = await db.fetch_one(query)
-    
-    if not record:
-        raise HTTPException(status_code=401, detail="User not found")
-        
-    hashed_input = hashlib.sha256(user.password.encode()).hexdigest()
-    if hashed_input != record["password_hash"]:
-        raise HTTPException(status_code=401, detail="Incorrect password")
-        
-    return {"status": "success", "username": record["username"]}
-
-# --- SENSORS & SIMULATOR ---
-@app.get("/sensors", response_model=List[SensorOut])
-async def get_sensors():
-    return await db.fetch_all(sqlalchemy.select([sensors]))
-
-@app.post("/sensors/{sensor_id}/trigger")
-async def manual_trigger(sensor_id: str, active: bool = True, event_text: str = "Manual Trigger"):
-    trigger_level = 0
-    if active:
-        # Determine Severity Level based on text from frontend
-        txt = event_text.lower()
-        if "break" in txt or "force" in txt or "critical" in txt:
-            trigger_level = 3 # Critical
-        elif "tamper" in txt or "warn" in txt:
-            trigger_level = 2 # Warning
-        else:
-            trigger_level = 1 # Standard
-
-    await db.execute(sensors.update().where(sensors.c.id == sensor_id).values(is_triggered=trigger_level))
-    
-    if active:
-        s = await db.fetch_one(sqlalchemy.select([sensors]).where(sensors.c.id == sensor_id))
-        severity = "critical" if trigger_level == 3 else ("warn" if trigger_level == 2 else "info")
-        await log_event(severity, "manual.trigger", {"sensor": s["name"], "msg": event_text})
-
-    return {"status": "updated", "level": trigger_level}
-
-@app.post("/sensors/{sensor_id}/reset")
-async def reset_sensor(sensor_id: str):
-    await db.execute(sensors.update().where(sensors.c.id == sensor_id).values(is_triggered=0))
-    return {"status": "reset"}
-
-# --- DATA ---
-@app.get("/events", response_model=List[EventOut])
-async def get_events(limit: int = 20):
-    return await db.fetch_all(sqlalchemy.select([events]).order_by(events.c.timestamp.desc()).limit(limit))
-
-@app.post("/assessment")
-async def save_assessment(data: RiskAssessmentIn):
-    risk = "Safe" if data.score >= 80 else "Risk"
-    await db.execute(risk_assessments.insert().values(
-        id=str(uuid.uuid4()),
-        timestamp=datetime.utcnow(),
-        score=data.score,
-        risk_level=risk,
-        details=json.dumps(data.details)
-    ))
-    return {"status": "saved"}
-
-@app.get("/assessment/latest", response_model=Optional[RiskAssessmentOut])
-async def get_latest_assessment():
-    return await db.fetch_one(sqlalchemy.select([risk_assessments]).order_by(risk_assessments.c.timestamp.desc()).limit(1))
-
+# backend.py
+# Requirements: pip install fastapi uvicorn sqlalchemy databases aiosqlite pydantic argon2-cffi orjson python-ulid
+# Optional (multi-worker broadcasts): pip install redis, then set REDIS_URL
+# Run command: uvicorn backend:app --reload
+
+import asyncio
+import os
+import random
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import monotonic
+from typing import List, Optional, Dict, Any
+
+import orjson
+from ulid import ULID
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ValidationError
+import sqlalchemy
+from databases import Database
+
+try:
+    # Optional: cross-worker broadcast bus (uvicorn --workers N)
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# --- DATABASE CONFIGURATION ---
+DATABASE_URL = "sqlite:///./smart_home.db"
+
+# --- EVENT BUS CONFIGURATION ---
+# With multiple uvicorn workers, each process only knows its own WebSocket
+# clients. Set REDIS_URL (e.g. redis://localhost) to fan events out through
+# Redis pub/sub; unset, broadcasts stay in-process.
+REDIS_URL = os.environ.get("REDIS_URL", "")
+EVENTS_CHANNEL = "events"
+bus = None
+
+# --- DATABASE SCHEMA ---
+metadata = sqlalchemy.MetaData()
+
+# 1. Users Table (Authentication)
+users = sqlalchemy.Table(
+    "users",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("username", sqlalchemy.String, unique=True, nullable=False),
+    sqlalchemy.Column("password_hash", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, default=datetime.utcnow),
+)
+
+# 2. Sensors Table (Device Status)
+# is_triggered: 0=Safe, 1=Standard (Blue), 2=Warning (Orange), 3=Critical (Red)
+sensors = sqlalchemy.Table(
+    "sensors",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("type", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("is_triggered", sqlalchemy.Integer, nullable=False, default=0),
+    sqlalchemy.Column("sensitivity", sqlalchemy.Float, nullable=False, default=1.0),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, default=datetime.utcnow),
+)
+
+# 3. Events Table (Logs)
+events = sqlalchemy.Table(
+    "events",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("timestamp", sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column("level", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("source", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("payload", sqlalchemy.String, nullable=True),
+)
+
+# 4. Risk Assessments Table (Quiz Results)
+risk_assessments = sqlalchemy.Table(
+    "risk_assessments",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("timestamp", sqlalchemy.DateTime, default=datetime.utcnow),
+    sqlalchemy.Column("score", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("risk_level", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("details", sqlalchemy.String, nullable=True),
+)
+
+# Newest-first indexes so /events and /assessment/latest avoid a full scan + sort
+sqlalchemy.Index("ix_events_ts", events.c.timestamp.desc())
+sqlalchemy.Index("ix_risk_ts", risk_assessments.c.timestamp.desc())
+
+engine = sqlalchemy.create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+metadata.create_all(engine)
+db = Database(DATABASE_URL)
+
+# --- PREPARED STATEMENTS ---
+# Built once at import so hot paths skip per-call SQL rendering
+EVENTS_INSERT = events.insert()
+# Parameterized text for update/select: databases only threads bindparams
+# through text queries, and this skips Core compilation per call entirely
+SENSORS_UPDATE_TRIGGER = "UPDATE sensors SET is_triggered = :lvl WHERE id = :sid"
+
+# --- PYDANTIC MODELS ---
+class UserAuth(BaseModel):
+    username: str
+    password: str
+
+class SensorOut(BaseModel):
+    id: str
+    name: str
+    type: str
+    is_triggered: int
+    sensitivity: float
+
+class EventOut(BaseModel):
+    id: str
+    timestamp: datetime
+    level: str
+    source: str
+    payload: Optional[Dict[str, Any]]
+
+class RiskAssessmentIn(BaseModel):
+    score: int
+    details: Dict[str, Any]
+
+class RiskAssessmentOut(BaseModel):
+    score: int
+    risk_level: str
+    timestamp: datetime
+
+# --- APP & MIDDLEWARE ---
+# orjson serializes responses (datetime/UUID included) far faster than stdlib json
+app = FastAPI(title="Smart Home Security Hub", default_response_class=ORJSONResponse)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"], # Allow HTML file to connect
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# --- WEBSOCKET MANAGER ---
+class ConnectionSlot:
+    """One WebSocket plus a bounded outbound queue drained by its own task.
+
+    The bound (64 frames) keeps a slow or stuck reader from buffering
+    unlimited broadcast data in server memory.
+    """
+    def __init__(self, ws: WebSocket, on_fail):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+        self._on_fail = on_fail
+        self.task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        try:
+            while True:
+                buf = await self.queue.get()
+                await self.ws.send_bytes(buf)
+        except Exception:
+            self._on_fail(self.ws)
+
+class ConnectionManager:
+    # Events landing within this window are coalesced into one batch frame,
+    # so a burst of triggers costs one serialization + one write per client
+    FLUSH_WINDOW = 0.02  # seconds
+
+    def __init__(self):
+        self.active: Dict[WebSocket, ConnectionSlot] = {}
+        self._pending: List[dict] = []
+        self._dirty = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+    def start(self):
+        self._flusher = asyncio.create_task(self._flush_loop())
+    def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+    async def connect(self, ws: WebSocket):
+        await ws.accept()
+        self.active[ws] = ConnectionSlot(ws, on_fail=self.disconnect)
+    def disconnect(self, ws: WebSocket):
+        slot = self.active.pop(ws, None)
+        if slot and not slot.task.done():
+            slot.task.cancel()
+    async def broadcast(self, message: dict):
+        self._pending.append(message)
+        self._dirty.set()
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(self.FLUSH_WINDOW)
+            # No await between drain and clear, so no message can slip through
+            batch, self._pending = self._pending, []
+            self._dirty.clear()
+            if batch and self.active:
+                # Serialize the whole batch once; each slot's pump task sends
+                # at its client's pace
+                self.broadcast_bytes(orjson.dumps({"type": "batch", "events": batch}))
+    def broadcast_bytes(self, buf: bytes):
+        for ws, slot in list(self.active.items()):
+            try:
+                slot.queue.put_nowait(buf)
+            except asyncio.QueueFull:
+                # Slow reader: drop the connection rather than buffer forever
+                self.disconnect(ws)
+
+manager = ConnectionManager()
+
+# --- RATE LIMITING ---
+# Token bucket per source IP on the auth endpoints: a bot storm gets 429s
+# in microseconds instead of each request paying the full Argon2 cost.
+RATE_LIMIT_CAPACITY = 5       # burst size
+RATE_LIMIT_REFILL = 0.5       # tokens per second
+RATE_LIMIT_MAX_ENTRIES = 10_000
+
+class TokenBucket:
+    __slots__ = ("tokens", "last")
+    def __init__(self, tokens: float, last: float):
+        self.tokens = tokens
+        self.last = last
+
+# LRU-ordered so memory stays bounded no matter how many IPs show up
+BUCKETS: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+def check_rate_limit(ip: str):
+    now = monotonic()
+    bucket = BUCKETS.pop(ip, None)  # pop + reinsert keeps LRU order
+    if bucket is None:
+        bucket = TokenBucket(RATE_LIMIT_CAPACITY, now)
+    else:
+        bucket.tokens = min(RATE_LIMIT_CAPACITY,
+                            bucket.tokens + (now - bucket.last) * RATE_LIMIT_REFILL)
+        bucket.last = now
+    BUCKETS[ip] = bucket
+    while len(BUCKETS) > RATE_LIMIT_MAX_ENTRIES:
+        BUCKETS.popitem(last=False)
+    if bucket.tokens < 1:
+        raise HTTPException(status_code=429, detail="Too many requests")
+    bucket.tokens -= 1
+
+# --- PASSWORD POLICY ---
+# Cheap pre-checks run before any Argon2 work, so garbage input from a
+# credential-stuffing burst is rejected without paying the hash cost.
+MIN_PASSWORD_LENGTH = 12
+COMMON_PASSWORDS = frozenset({
+    "password", "password1", "password123", "123456", "12345678", "123456789",
+    "1234567890", "qwerty", "qwertyuiop", "letmein", "welcome", "iloveyou",
+    "admin", "administrator", "abc123", "monkey", "dragon", "sunshine",
+    "princess", "football", "baseball", "master", "shadow", "superman",
+    "trustno1", "passw0rd", "password!", "changeme",
+})
+
+def password_is_weak(password: str) -> bool:
+    if len(password) < MIN_PASSWORD_LENGTH:
+        return True
+    if password.lower() in COMMON_PASSWORDS:
+        return True
+    classes = sum((
+        any(c.islower() for c in password),
+        any(c.isupper() for c in password),
+        any(c.isdigit() for c in password),
+        any(not c.isalnum() for c in password),
+    ))
+    return classes < 3
+
+# --- PASSWORD HASHING ---
+# Argon2id: memory-hard and tunable, unlike a bare SHA-256 digest.
+# Salt and cost parameters are encoded into the hash string itself.
+ph = PasswordHasher(time_cost=3, memory_cost=64 * 1024, parallelism=4)
+
+# --- SEVERITY CLASSIFICATION ---
+# keyword -> trigger level; unmatched text of an active trigger is level 1
+SEVERITY_KEYWORDS = {"break": 3, "force": 3, "critical": 3, "tamper": 2, "warn": 2}
+SEVERITY_NAME = {3: "critical", 2: "warn", 1: "info", 0: "info"}
+
+# --- SENSOR CACHE ---
+# id -> row dict, loaded at startup and kept in sync by the trigger/reset
+# handlers, so the hot paths never SELECT just to fetch a sensor name
+SENSOR_CACHE: Dict[str, dict] = {}
+
+# --- HELPERS ---
+def new_id() -> str:
+    """Row id: ULIDs are time-ordered (so event ids cluster with the
+    timestamp index) and amortize entropy reads instead of paying a
+    getrandom syscall per uuid4."""
+    return str(ULID())
+
+async def parse_body(request: Request, model):
+    """Validate the raw request body in one pass (pydantic's jiter parser),
+    skipping FastAPI's intermediate json.loads -> dict -> validate round."""
+    try:
+        return model.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+async def log_event(level: str, source: str, payload: Optional[dict] = None):
+    ev_id = new_id()
+    now = datetime.utcnow()
+    await db.execute(EVENTS_INSERT, values={
+        "id": ev_id, "timestamp": now, "level": level, "source": source,
+        "payload": orjson.dumps(payload).decode() if payload else None
+    })
+    msg = {"type": "event", "event": {"level": level, "source": source, "payload": payload}}
+    if bus is not None:
+        # Publish to Redis; every worker's subscriber loop fans out locally
+        await bus.publish(EVENTS_CHANNEL, orjson.dumps(msg))
+    else:
+        await manager.broadcast(msg)
+
+async def _subscribe_loop():
+    pubsub = bus.pubsub()
+    await pubsub.subscribe(EVENTS_CHANNEL)
+    async for m in pubsub.listen():
+        if m["type"] == "message":
+            manager.broadcast_bytes(m["data"])
+
+# --- LIFECYCLE ---
+@app.on_event("startup")
+async def startup():
+    # Size the default executor so parallel logins (Argon2 hashing) scale with cores
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=os.cpu_count()))
+    if REDIS_URL:
+        if aioredis is None:
+            raise RuntimeError("REDIS_URL is set but the redis package is not installed")
+        global bus
+        bus = aioredis.from_url(REDIS_URL)
+        asyncio.create_task(_subscribe_loop())
+    manager.start()
+    await db.connect()
+    # WAL lets readers proceed while log_event writes; NORMAL sync is safe in WAL
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute("PRAGMA temp_store=MEMORY")
+    await db.execute("PRAGMA mmap_size=268435456")
+    await db.execute("PRAGMA cache_size=-65536")
+    # create_all only adds indexes alongside new tables; cover existing DBs too
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_events_ts ON events (timestamp DESC)")
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_risk_ts ON risk_assessments (timestamp DESC)")
+    # Virtual column over the JSON payload so /events?sensor=... is an
+    # indexed lookup instead of a payload-parsing table scan
+    event_cols = await db.fetch_all("PRAGMA table_xinfo(events)")  # xinfo lists generated columns
+    if not any(c["name"] == "sensor_name" for c in event_cols):
+        await db.execute(
+            "ALTER TABLE events ADD COLUMN sensor_name TEXT "
+            "GENERATED ALWAYS AS (json_extract(payload, '$.sensor')) VIRTUAL"
+        )
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_events_sensor ON events (sensor_name)")
+    # Seed Sensors if empty (single batched INSERT instead of one round-trip per row)
+    if await db.fetch_val(sqlalchemy.select([sqlalchemy.func.count()]).select_from(sensors)) == 0:
+        seed = [
+            ("Front Door", "door"),
+            ("Kitchen Window", "window"),
+            ("Living Room Motion", "motion"),
+            ("Backyard Camera", "camera")
+        ]
+        await db.execute_many(query=sensors.insert(), values=[
+            {"id": new_id(), "name": name, "type": type_,
+             "is_triggered": 0, "sensitivity": 1.0, "created_at": datetime.utcnow()}
+            for name, type_ in seed
+        ])
+    SENSOR_CACHE.clear()
+    SENSOR_CACHE.update({r["id"]: dict(r) for r in await db.fetch_all(sqlalchemy.select([sensors]))})
+
+@app.on_event("shutdown")
+async def shutdown():
+    manager.stop()
+    if bus is not None:
+        await bus.aclose()
+    await db.disconnect()
+
+# ================= ENDPOINTS =================
+
+@app.get("/")
+async def root():
+    return {"status": "Smart Home Backend Online"}
+
+# --- AUTH ---
+@app.post("/register")
+async def register(request: Request):
+    check_rate_limit(request.client.host if request.client else "unknown")
+    user = await parse_body(request, UserAuth)
+
+    if password_is_weak(user.password):
+        raise HTTPException(
+            status_code=400,
+            detail="Password too weak: use at least 12 characters mixing "
+                   "upper/lower case, digits, and symbols"
+        )
+
+    # Check existing
+    query = sqlalchemy.select([users]).where(users.c.username == user.username)
+    if await db.fetch_one(query):
+        raise HTTPException(status_code=400, detail="Username already exists")
+
+    # Hash Password (Argon2id) on the thread pool so the event loop keeps serving
+    hashed = await asyncio.get_running_loop().run_in_executor(None, ph.hash, user.password)
+
+    await db.execute(users.insert().values(
+        id=new_id(),
+        username=user.username,
+        password_hash=hashed,
+        created_at=datetime.utcnow()
+    ))
+    return {"status": "success"}
+
+@app.post("/login")
+async def login(request: Request):
+    check_rate_limit(request.client.host if request.client else "unknown")
+    user = await parse_body(request, UserAuth)
+    query = sqlalchemy.select([users]).where(users.c.username == user.username)
+    record = await db.fetch_one(query)
+    
+    if not record:
+        raise HTTPException(status_code=401, detail="User not found")
+        
+    loop = asyncio.get_running_loop()
+    try:
+        # Verify on the thread pool so the event loop keeps serving.
+        # Argon2's verify is constant-time, so no timing oracle here
+        # (unlike a plain != compare of hex digests).
+        await loop.run_in_executor(None, ph.verify, record["password_hash"], user.password)
+    except VerifyMismatchError:
+        raise HTTPException(status_code=401, detail="Incorrect password")
+
+    # Transparently upgrade hashes if cost parameters change later
+    if ph.check_needs_rehash(record["password_hash"]):
+        rehashed = await loop.run_in_executor(None, ph.hash, user.password)
+        await db.execute(users.update().where(users.c.id == record["id"]).values(
+            password_hash=rehashed
+        ))
+
+    return {"status": "success", "username": record["username"]}
+
+# --- SENSORS & SIMULATOR ---
+# response_model validation re-checks every trusted row on every request;
+# document the schema in OpenAPI but serialize the rows directly instead.
+# SENSOR_CACHE is authoritative here — populated at startup and mutated only
+# by the trigger/reset handlers — so the frontend's polling never hits the DB.
+@app.get("/sensors", responses={200: {"model": List[SensorOut]}})
+async def get_sensors():
+    return ORJSONResponse([
+        {"id": s["id"], "name": s["name"], "type": s["type"],
+         "is_triggered": s["is_triggered"], "sensitivity": s["sensitivity"]}
+        for s in SENSOR_CACHE.values()
+    ])
+
+@app.post("/sensors/{sensor_id}/trigger")
+async def manual_trigger(sensor_id: str, active: bool = True, event_text: str = "Manual Trigger"):
+    trigger_level = 0
+    if active:
+        # Determine Severity Level based on text from frontend
+        txt = event_text.lower()
+        trigger_level = max((lvl for kw, lvl in SEVERITY_KEYWORDS.items() if kw in txt), default=1)
+
+    s = SENSOR_CACHE.get(sensor_id)
+    if s is None:
+        raise HTTPException(status_code=404, detail="Sensor not found")
+
+    if active:
+        severity = SEVERITY_NAME[trigger_level]
+        # One transaction, update + event insert submitted together —
+        # the cache already has the sensor name, so no SELECT round-trip
+        async with db.transaction():
+            await asyncio.gather(
+                db.execute(SENSORS_UPDATE_TRIGGER, {"sid": sensor_id, "lvl": trigger_level}),
+                log_event(severity, "manual.trigger", {"sensor": s["name"], "msg": event_text}),
+            )
+    else:
+        await db.execute(SENSORS_UPDATE_TRIGGER, {"sid": sensor_id, "lvl": trigger_level})
+
+    s["is_triggered"] = trigger_level
+    return {"status": "updated", "level": trigger_level}
+
+@app.post("/sensors/{sensor_id}/reset")
+async def reset_sensor(sensor_id: str):
+    await db.execute(SENSORS_UPDATE_TRIGGER, {"sid": sensor_id, "lvl": 0})
+    if sensor_id in SENSOR_CACHE:
+        SENSOR_CACHE[sensor_id]["is_triggered"] = 0
+    return {"status": "reset"}
+
+# --- DATA ---
+@app.get("/events", responses={200: {"model": List[EventOut]}})
+async def get_events(limit: int = 20, sensor: Optional[str] = None):
+    query = sqlalchemy.select([events]).order_by(events.c.timestamp.desc()).limit(limit)
+    if sensor is not None:
+        # sensor_name is the generated column over payload's $.sensor;
+        # it only exists DB-side, hence literal_column
+        query = query.where(sqlalchemy.literal_column("sensor_name") == sensor)
+    rows = await db.fetch_all(query)
+    out = []
+    for r in rows:
+        row = dict(r)
+        # Decode the stored JSON once here so clients get a nested object,
+        # not an escaped string
+        row["payload"] = orjson.loads(row["payload"]) if row["payload"] else None
+        out.append(row)
+    return ORJSONResponse(out)
+
+@app.post("/assessment")
+async def save_assessment(request: Request):
+    data = await parse_body(request, RiskAssessmentIn)
+    risk = "Safe" if data.score >= 80 else "Risk"
+    await db.execute(risk_assessments.insert().values(
+        id=new_id(),
+        timestamp=datetime.utcnow(),
+        score=data.score,
+        risk_level=risk,
+        details=orjson.dumps(data.details).decode()
+    ))
+    return {"status": "saved"}
+
+@app.get("/assessment/latest", response_model=Optional[RiskAssessmentOut])
+async def get_latest_assessment():
+    return await db.fetch_one(sqlalchemy.select([risk_assessments]).order_by(risk_assessments.c.timestamp.desc()).limit(1))
+